@@ -4,24 +4,79 @@ Agent definitions for the multi‑agent RAG system.
 This module defines the shared state type and four agents:
 planner, retriever, tool executor, and synthesiser. These agents operate on
 WorkflowState dictionaries and mutate state to reflect decisions, retrieved
-context, tool outputs and final answers.
+context, tool outputs and final answers. The tool executor also has an async
+variant so network-bound tools can be awaited, and a speculative retriever can
+run alongside the planner.
 
-The module also exposes functions to set the global vector store and LLM
-used by the retrieval and synthesis agents. These should be called by
-initialisation code (e.g., in orchestrator.py) before invoking the agents.
+The module also exposes functions to set the global vector store, LLM and
+context token budget used by the retrieval and synthesis agents. These should
+be called by initialisation code (e.g., in orchestrator.py) before invoking the agents.
 """
 from __future__ import annotations
-from typing import List, Dict, Any, TypedDict
+from typing import List, Dict, Any, Optional, TypedDict
 import re
 import json
+from langchain_core.runnables import RunnableConfig
+
+try:  # optional: pyahocorasick for single-pass keyword routing
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 # Import tools and rag functions
-from .tools import weather_tool_call, calculator_tool_call
-from .rag import retrieve_rag_chunks, generate_answer_from_context
+from .tools import weather_tool_call, weather_tool_call_async, calculator_tool_call
+from .rag import retrieve_rag_chunks, generate_answer_from_context, get_llm_tokenizer, get_llm_max_prompt_tokens
+
+# Routing patterns, compiled once at import
+_MATH_RE = re.compile(r"\d+\s*[+\-*/]\s*\d+")
+_CALC_WORD_RE = re.compile(r"(?i)\bcalculate\b")
+
+# Keyword -> route table for the planner
+_ROUTE_KEYWORDS = (
+    ("weather", "weather"),
+    ("temperature", "weather"),
+    ("forecast", "weather"),
+    ("calculate", "calc"),
+)
+
+
+def _build_route_matcher():
+    """Compile all route keywords into one matcher returning the set of routes found in a text.
+
+    Uses an Aho-Corasick automaton when pyahocorasick is installed, so routing is a single
+    O(len(query)) scan regardless of the number of keywords; otherwise falls back to one
+    precompiled regex alternation.
+    """
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for kw, route in _ROUTE_KEYWORDS:
+            automaton.add_word(kw, route)
+        automaton.make_automaton()
+        return lambda text: {route for _, route in automaton.iter(text)}
+    routes = dict(_ROUTE_KEYWORDS)
+    pattern = re.compile("|".join(re.escape(kw) for kw, _ in _ROUTE_KEYWORDS))
+    return lambda text: {routes[m] for m in pattern.findall(text)}
+
+
+_match_routes = _build_route_matcher()
+
+
+def tool_for_query(query: str) -> str:
+    """Name of the tool the planner routes a query to ("weather" or "calculator"), or "" for RAG."""
+    q = query.strip()
+    routes = _match_routes(q.lower())
+    if "weather" in routes:
+        return "weather"
+    if "calc" in routes or _MATH_RE.search(q):
+        return "calculator"
+    return ""
+
 
 # Globals to store vector store and LLM for retrieval and synthesis agents
 _vector_store = None
 _llm = None
+# Token budget for retrieved context (None = no cap)
+_max_context_tokens: Optional[int] = None
 
 
 def set_vector_store(vector_store):
@@ -31,24 +86,34 @@ def set_vector_store(vector_store):
 
 
 def set_llm(llm):
-    """Set the global HuggingFace pipeline for synthesis."""
+    """Set the global LLM (HuggingFace or vLLM backend) for synthesis."""
     global _llm
     _llm = llm
 
 
+def set_max_context_tokens(max_tokens: Optional[int]):
+    """Override the token budget for retrieved context (None derives it from the LLM's tokenizer)."""
+    global _max_context_tokens
+    _max_context_tokens = max_tokens
+
+
 class WorkflowState(TypedDict):
     """Typed dictionary defining the state shared across agents."""
     user_query: str
     operation: str            # "rag" | "tool"
     plan: str
     react_steps: List[Dict[str, Any]]
-    retrieved_context: str
+    retrieved_context: List[str]  # formatted chunk strings, joined only at prompt time
     citations: List[Dict[str, Any]]
     tool_name: str
     tool_input: Dict[str, Any]
     tool_result: Dict[str, Any]
     final_answer: str
     error: str
+    query_vector: Optional[List[float]]  # query embedding from the answer cache, reused by retrieval
+    # Written only by speculative_retrieval_agent, which runs in parallel with the planner
+    speculative_context: List[str]
+    speculative_citations: List[Dict[str, Any]]
 
 
 def planning_agent(state: WorkflowState) -> WorkflowState:
@@ -65,14 +130,15 @@ def planning_agent(state: WorkflowState) -> WorkflowState:
     # reset fields for a new plan
     state["react_steps"] = []
     state["error"] = ""
-    state["retrieved_context"] = ""
+    state["retrieved_context"] = []
     state["citations"] = []
     state["tool_result"] = {}
     state["tool_input"] = {}
     state["tool_name"] = ""
 
     # Routing rules
-    if "weather" in ql or "temperature" in ql or "forecast" in ql:
+    tool = tool_for_query(q)
+    if tool == "weather":
         state["operation"] = "tool"
         state["tool_name"] = "weather"
         # Extract location after "in" if present, else default to Chennai
@@ -82,10 +148,10 @@ def planning_agent(state: WorkflowState) -> WorkflowState:
             loc = "Chennai"
         state["tool_input"] = {"location": loc, "days": 3}
         state["plan"] = "Call weather tool (no API key) using Open‑Meteo."
-    elif "calculate" in ql or re.search(r"\d+\s*[\+\-\*\/]\s*\d+", q):
+    elif tool == "calculator":
         state["operation"] = "tool"
         state["tool_name"] = "calculator"
-        expr = re.sub(r"(?i)\bcalculate\b", "", q).strip()
+        expr = _CALC_WORD_RE.sub("", q).strip()
         state["tool_input"] = {"expression": expr if expr else q}
         state["plan"] = "Call calculator tool to compute the expression."
     else:
@@ -96,20 +162,52 @@ def planning_agent(state: WorkflowState) -> WorkflowState:
     return state
 
 
+def _retrieve(query: str, query_vector: Optional[List[float]] = None):
+    """Run retrieval for a query, reusing its embedding if given; returns (context parts, citations)."""
+    if _vector_store is None:
+        raise RuntimeError("Vector store is not initialised. Call set_vector_store() before invoking retrieval_agent.")
+    tokenizer = get_llm_tokenizer(_llm) if _llm is not None else None
+    max_prompt_tokens = get_llm_max_prompt_tokens(_llm) if _llm is not None else None
+    return retrieve_rag_chunks(
+        _vector_store, query, k=3, max_context_tokens=_max_context_tokens, tokenizer=tokenizer,
+        query_vector=query_vector, max_prompt_tokens=max_prompt_tokens,
+    )
+
+
+def speculative_retrieval_agent(state: WorkflowState) -> Dict[str, Any]:
+    """
+    Retrieve context for the query before the planner has decided on a route.
+
+    Runs in parallel with planning_agent, so it returns only its own keys rather than
+    the whole state (parallel nodes must not write the same state keys). It is only
+    started for queries that tool_for_query sends to RAG, so its result is always
+    adopted by retrieval_agent.
+    Errors are swallowed here; retrieval_agent then retries retrieval itself and
+    surfaces the error.
+    """
+    try:
+        parts, citations = _retrieve(state["user_query"], state.get("query_vector"))
+    except Exception:
+        return {}
+    return {"speculative_context": parts, "speculative_citations": citations}
+
+
 def retrieval_agent(state: WorkflowState) -> WorkflowState:
     """
     Retrieve relevant context from the vector store for the user's query.
 
-    The retrieved context and citations are stored in the state. Also logs the action
-    and observation in the ReAct trace.
+    If speculative retrieval already ran for this query its results are reused;
+    otherwise the vector store is searched. The retrieved context and citations are
+    stored in the state. Also logs the action and observation in the ReAct trace.
     """
-    if _vector_store is None:
-        raise RuntimeError("Vector store is not initialised. Call set_vector_store() before invoking retrieval_agent.")
-
     q = state["user_query"]
-    state["react_steps"].append({"act": "RAG.retrieve", "input": q})
-    context, citations = retrieve_rag_chunks(_vector_store, q, k=3)
-    state["retrieved_context"] = context
+    if "speculative_context" in state:
+        state["react_steps"].append({"act": "RAG.retrieve", "input": q, "speculative": True})
+        parts, citations = state["speculative_context"], state["speculative_citations"]
+    else:
+        state["react_steps"].append({"act": "RAG.retrieve", "input": q})
+        parts, citations = _retrieve(q, state.get("query_vector"))
+    state["retrieved_context"] = parts
     state["citations"] = citations
     state["react_steps"].append({"observe": f"Retrieved {len(citations)} chunks"})
     return state
@@ -131,11 +229,29 @@ def tool_execution_agent(state: WorkflowState) -> WorkflowState:
     return state
 
 
-def synthesis_agent(state: WorkflowState) -> WorkflowState:
+async def tool_execution_agent_async(state: WorkflowState) -> WorkflowState:
+    """Async variant of tool_execution_agent; network-bound tools are awaited instead of blocking."""
+    tname = state.get("tool_name", "")
+    tinp = state.get("tool_input", {})
+    state["react_steps"].append({"act": "Tool.call", "tool": tname, "input": tinp})
+    if tname == "weather":
+        result = await weather_tool_call_async(tinp)
+    elif tname == "calculator":
+        result = calculator_tool_call(tinp)
+    else:
+        result = {"ok": False, "error": f"Unknown tool: {tname}"}
+    state["tool_result"] = result
+    state["react_steps"].append({"observe": result})
+    return state
+
+
+def synthesis_agent(state: WorkflowState, config: Optional[RunnableConfig] = None) -> WorkflowState:
     """
     Synthesise the final answer based on the chosen operation (rag or tool).
 
-    If using RAG, it calls the LLM to generate a grounded answer.
+    If using RAG, it calls the LLM to generate a grounded answer. When the graph is run
+    with an ``on_token`` callable in ``config["configurable"]``, the answer is streamed
+    to it as it is generated.
     If using a tool, it formats the tool's output into a user-friendly answer.
     The synthesiser does not add citations for tool results.
     """
@@ -144,9 +260,10 @@ def synthesis_agent(state: WorkflowState) -> WorkflowState:
         if _llm is None:
             raise RuntimeError("LLM is not initialised. Call set_llm() before invoking synthesis_agent.")
         q = state["user_query"]
-        context = state.get("retrieved_context", "")
+        context_parts = state.get("retrieved_context", [])
         state["react_steps"].append({"act": "LLM.generate_grounded_answer"})
-        ans = generate_answer_from_context(_llm, context, q)
+        on_token = (config or {}).get("configurable", {}).get("on_token")
+        ans = generate_answer_from_context(_llm, context_parts, q, on_token=on_token)
         state["final_answer"] = ans
         # keep citations already stored
     elif op == "tool":
@@ -0,0 +1,81 @@
+"""
+Semantic answer cache for the RAG pipeline.
+
+Paraphrases of the same question produce nearly identical query embeddings, so RAG
+answers are cached against the normalised embedding of the query. A lookup is a
+single inner-product search over a small FAISS index; on a hit (cosine similarity
+above the threshold) the stored answer and citations are returned and the LLM is
+not called at all.
+"""
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import copy
+import threading
+import numpy as np
+import faiss
+from langchain_core.embeddings import Embeddings
+
+__all__ = ["SemanticCache"]
+
+
+class SemanticCache:
+    """Bounded LRU cache of answers keyed by query-embedding similarity.
+
+    Args:
+        embeddings: Embedding model used to embed queries (the same one as the vector store).
+        threshold: Minimum cosine similarity for a cached answer to be reused.
+        max_entries: Maximum number of cached answers; the least recently used is evicted.
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = 0.95, max_entries: int = 256):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._index: Optional[faiss.IndexIDMap2] = None  # created on first insert, once the dimension is known
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        # Gradio runs handlers in a thread pool
+        self._lock = threading.Lock()
+
+    def embed(self, query: str) -> np.ndarray:
+        """Embed a query as a (1, d) float32 row with unit L2 norm."""
+        vec = np.asarray([self.embeddings.embed_query(query)], dtype="float32")
+        faiss.normalize_L2(vec)
+        return vec
+
+    def lookup(self, query_vec: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached entry most similar to query_vec, or None if none is close enough."""
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(query_vec, 1)
+            key = int(ids[0][0])
+            if key == -1 or scores[0][0] < self.threshold:
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(self._entries[key])
+
+    def insert(self, query_vec: np.ndarray, value: Dict[str, Any]) -> None:
+        """Cache a copy of value under query_vec, evicting the least recently used entry if full.
+
+        Entries are copied in and out so callers mutating a response cannot change it.
+        """
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(query_vec.shape[1]))
+            key = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(query_vec, np.array([key], dtype="int64"))
+            self._entries[key] = copy.deepcopy(value)
+            if len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._index.remove_ids(np.array([oldest], dtype="int64"))
+
+    def clear(self) -> None:
+        """Drop all cached answers."""
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -8,20 +8,27 @@ reasoning steps.
 import json
 import gradio as gr
 
-from .orchestrator import handle_user_query
+from .orchestrator import stream_user_query_async
 
 
-def interface_function(user_query: str):
-    """Callback to process a user query and return answer, citations and react trace."""
-    res = handle_user_query(user_query)
-    answer = res.get("answer", "")
-    citations = res.get("citations", [])
-    if citations:
-        citation_text = "\n".join([f"- {c['source']} (page {c['page']})" for c in citations])
-    else:
-        citation_text = "No citations available."
-    react_trace = json.dumps(res.get("react_steps", []), indent=2)
-    return answer, citation_text, react_trace
+async def interface_function(user_query: str):
+    """Callback to process a user query and stream answer, citations and react trace.
+
+    The answer box is updated as tokens are generated; citations and the trace are
+    filled in once the answer is complete.
+    """
+    async for res in stream_user_query_async(user_query):
+        answer = res.get("answer", "")
+        if res.get("partial"):
+            yield answer, "", ""
+            continue
+        citations = res.get("citations", [])
+        if citations:
+            citation_text = "\n".join([f"- {c['source']} (page {c['page']})" for c in citations])
+        else:
+            citation_text = "No citations available."
+        react_trace = json.dumps(res.get("react_steps", []), indent=2)
+        yield answer, citation_text, react_trace
 
 
 # def launch_demo():
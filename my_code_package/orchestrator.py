@@ -3,42 +3,80 @@ Graph orchestration using LangGraph.
 
 This module sets up the global vector store and LLM, builds a StateGraph with
 conditional routing, and provides a function to handle a user query by invoking the graph.
+RAG answers are kept in a semantic cache so paraphrased questions skip the graph entirely,
+and can be streamed token by token to the UI.
 """
-from typing import Dict, Any
-from langgraph.graph import StateGraph, END
+from typing import Dict, Any, AsyncIterator, Callable, Optional
+import asyncio
+import numpy as np
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, START, END
 
 from .agents import (
     WorkflowState,
     planning_agent,
+    speculative_retrieval_agent,
+    tool_for_query,
     retrieval_agent,
     tool_execution_agent,
+    tool_execution_agent_async,
     synthesis_agent,
     set_vector_store,
     set_llm,
+    set_max_context_tokens,
 )
 from .rag import initialize_vector_store, create_local_llm
+from .cache import SemanticCache
 
-# Build the graph on import to avoid repeated compilation
+# Semantic cache of RAG answers; None disables caching
+_answer_cache: Optional[SemanticCache] = None
 
-def initialise_system(pdf_path: str, faiss_directory: str = "./faiss_store") -> None:
+
+def initialise_system(
+    pdf_path: str,
+    faiss_directory: str = "./faiss_store",
+    use_answer_cache: bool = True,
+    max_context_tokens: Optional[int] = None,
+) -> None:
     """
     Initialise the vector store and LLM and register them with the agents.
     Must be called before using handle_user_query.
+
+    If use_answer_cache is True, RAG answers are cached by query-embedding similarity
+    (using the vector store's embedding model) and reused for paraphrased questions.
+    The retrieved context is capped so the prompt fits the LLM's prompt limit (see
+    get_llm_max_prompt_tokens); max_context_tokens overrides that budget with a fixed
+    number of context tokens.
     """
+    global _answer_cache
     vs = initialize_vector_store(pdf_path=pdf_path, faiss_directory=faiss_directory)
-    llm = create_local_llm(model_id="google/flan-t5-base", max_new_tokens=220)
+    llm = create_local_llm(max_new_tokens=220)
     set_vector_store(vs)
     set_llm(llm)
+    set_max_context_tokens(max_context_tokens)
+    _answer_cache = SemanticCache(vs.embeddings) if use_answer_cache else None
 
 
 def build_graph() -> StateGraph:
-    """Construct the LangGraph for the multi-agent workflow."""
+    """Construct the LangGraph for the multi-agent workflow.
+
+    Retrieval starts speculatively in parallel with the planner (fan-out from START),
+    so on the RAG route the "rag" node only adopts results that are already there.
+    Tool queries skip it, so they never wait for a retrieval whose result is discarded.
+    """
     graph = StateGraph(WorkflowState)
     graph.add_node("planner", planning_agent)
+    graph.add_node("speculative_rag", speculative_retrieval_agent)
     graph.add_node("rag", retrieval_agent)
-    graph.add_node("tool", tool_execution_agent)
+    # Sync entry point for invoke(), native coroutine for ainvoke()
+    graph.add_node("tool", RunnableLambda(tool_execution_agent, afunc=tool_execution_agent_async))
     graph.add_node("synth", synthesis_agent)
-    graph.set_entry_point("planner")
+    graph.add_edge(START, "planner")
+    # Speculate only on queries the planner will send to RAG
+    def speculate_route(state: WorkflowState) -> str:
+        return END if tool_for_query(state["user_query"]) else "speculative_rag"
+    graph.add_conditional_edges(START, speculate_route, [END, "speculative_rag"])
+    graph.add_edge("speculative_rag", END)
     # Function to route to rag or tool based on state.operation
     def route_agent(state: WorkflowState) -> str:
         return "tool" if state.get("operation") == "tool" else "rag"
@@ -52,39 +90,43 @@ def build_graph() -> StateGraph:
     graph.add_edge("synth", END)
     return graph
 
-# Compile graph once
-_graph = None
-
 
-def get_app_graph() -> StateGraph:
-    global _graph
-    if _graph is None:
-        g = build_graph()
-        _graph = g.compile()
-    return _graph
+# Build and compile the graph once at import so queries never pay for compilation
+_graph = build_graph().compile()
 
-
-def handle_user_query(user_query: str) -> Dict[str, Any]:
-    """
-    Invoke the compiled graph on a user query and return a dict with answer and metadata.
-    The system must be initialised via `initialise_system()` before calling this.
-    """
-    graph = get_app_graph()
-    init_state: WorkflowState = {
+def _new_state(user_query: str, query_vec: Optional[np.ndarray] = None) -> WorkflowState:
+    """Initial graph state for a user query, carrying its cache embedding if there is one."""
+    return {
         "user_query": user_query,
         "operation": "",
         "plan": "",
         "react_steps": [],
-        "retrieved_context": "",
+        "retrieved_context": [],
         "citations": [],
         "tool_name": "",
         "tool_input": {},
         "tool_result": {},
         "final_answer": "",
         "error": "",
+        "query_vector": query_vec[0].tolist() if query_vec is not None else None,
     }
-    out = graph.invoke(init_state)
+
+
+def _cached_response(user_query: str, query_vec: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Return the semantic-cache response for a query, or None on a miss."""
+    cached = _answer_cache.lookup(query_vec)
+    if cached is None:
+        return None
     return {
+        **cached,
+        "query": user_query,
+        "react_steps": cached["react_steps"] + [{"observe": "Answer served from semantic cache"}],
+    }
+
+
+def _finish(user_query: str, out: Dict[str, Any], query_vec: Optional[np.ndarray]) -> Dict[str, Any]:
+    """Build the response dict from the final graph state and cache it if it is a RAG answer."""
+    res = {
         "query": user_query,
         "operation": out.get("operation"),
         "plan": out.get("plan"),
@@ -94,3 +136,75 @@ def handle_user_query(user_query: str) -> Dict[str, Any]:
         "tool_name": out.get("tool_name", ""),
         "tool_result": out.get("tool_result", {}),
     }
+    # Only grounded answers are cached; tool results are live (weather) or exact (calculator)
+    if query_vec is not None and res["operation"] == "rag":
+        _answer_cache.insert(query_vec, res)
+    return res
+
+
+def _graph_config(on_token: Optional[Callable[[str], None]]) -> Optional[Dict[str, Any]]:
+    """Graph run config carrying the synthesis token callback, if any."""
+    return {"configurable": {"on_token": on_token}} if on_token is not None else None
+
+
+def handle_user_query(user_query: str, on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Invoke the compiled graph on a user query and return a dict with answer and metadata.
+    The system must be initialised via `initialise_system()` before calling this.
+
+    If on_token is given, it is called with each piece of a RAG answer as it is generated.
+    """
+    query_vec = None
+    if _answer_cache is not None:
+        query_vec = _answer_cache.embed(user_query)
+        cached = _cached_response(user_query, query_vec)
+        if cached is not None:
+            return cached
+
+    out = _graph.invoke(_new_state(user_query, query_vec), config=_graph_config(on_token))
+    return _finish(user_query, out, query_vec)
+
+
+async def handle_user_query_async(
+    user_query: str, on_token: Optional[Callable[[str], None]] = None
+) -> Dict[str, Any]:
+    """
+    Async version of handle_user_query for async callers such as the Gradio UI.
+
+    Network-bound tools are awaited; CPU-bound steps (embedding, retrieval, generation)
+    run in worker threads so the event loop stays free for other users. on_token, if
+    given, is called from the generation worker thread.
+    """
+    query_vec = None
+    if _answer_cache is not None:
+        query_vec = await asyncio.to_thread(_answer_cache.embed, user_query)
+        cached = _cached_response(user_query, query_vec)
+        if cached is not None:
+            return cached
+
+    out = await _graph.ainvoke(_new_state(user_query, query_vec), config=_graph_config(on_token))
+    return _finish(user_query, out, query_vec)
+
+
+async def stream_user_query_async(user_query: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Like handle_user_query_async, but yields the answer while it is being generated.
+
+    Yields {"answer": partial_answer, "partial": True} as tokens arrive, then the full
+    response dict returned by handle_user_query_async. Tool and cached answers are not
+    streamed and only produce the final dict.
+    """
+    loop = asyncio.get_running_loop()
+    tokens: asyncio.Queue = asyncio.Queue()
+
+    def on_token(text: str) -> None:
+        # Runs in the generation worker thread; hand the text over to the event loop
+        loop.call_soon_threadsafe(tokens.put_nowait, text)
+
+    task = asyncio.create_task(handle_user_query_async(user_query, on_token=on_token))
+    task.add_done_callback(lambda _: tokens.put_nowait(None))
+    partial = ""
+    while (text := await tokens.get()) is not None:
+        partial += text
+        yield {"answer": partial, "partial": True}
+    yield await task
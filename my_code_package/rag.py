@@ -2,41 +2,215 @@
 RAG functions: loading PDF, chunking, embedding with HuggingFace, building FAISS vector stores, and generating answers.
 This module replicates the logic from the user's Jupyter notebook but in a Python module.
 """
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Callable, Iterator, Optional, Sequence, Union
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import asyncio
+import importlib.util
 import os
-from pypdf import PdfReader
+import pickle
+import queue
+import threading
+import uuid
+import faiss
+import numpy as np
+import torch
+try:  # PyMuPDF: C-backed PDF parsing, much faster than pure-Python pypdf
+    import fitz
+except ImportError:
+    fitz = None
+    from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFacePipeline
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+from langchain_huggingface import HuggingFaceEmbeddings
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, BitsAndBytesConfig, TextIteratorStreamer
 
 # Public API
 __all__ = [
     "extract_pdf_pages",
     "initialize_vector_store",
     "retrieve_rag_chunks",
+    "HFSeq2SeqBackend",
+    "VLLMBackend",
     "create_local_llm",
+    "get_llm_tokenizer",
+    "get_llm_max_prompt_tokens",
     "generate_answer_from_context",
 ]
 
-def extract_pdf_pages(path: str) -> List[Document]:
-    """Extracts text pages from a PDF into Document objects with metadata."""
+# Default generation models per backend. vLLM only serves decoder-only models, so it
+# cannot run flan-t5; a small instruction-tuned decoder is used instead.
+DEFAULT_HF_MODEL = "google/flan-t5-base"
+DEFAULT_VLLM_MODEL = "Qwen/Qwen2.5-0.5B-Instruct"
+
+# Fixed prompt scaffolding for grounded answers. The preamble is the identical prefix of
+# every prompt, which lets vLLM's prefix cache reuse its KV blocks across queries.
+PROMPT_PREAMBLE = (
+    "Answer the question strictly using the context below.\n"
+    "If the answer is not present in the context, say: \"I don't know from the provided documents.\"\n\n"
+    "Context:\n"
+)
+CONTEXT_SEPARATOR = "\n\n"
+QUESTION_PREFIX = "\n\nQuestion: "
+ANSWER_SUFFIX = "\nAnswer:"
+STATIC_PROMPT_PIECES = (PROMPT_PREAMBLE, CONTEXT_SEPARATOR, QUESTION_PREFIX, ANSWER_SUFFIX)
+
+# Corpora at least this large use IVF-PQ FastScan; smaller ones use HNSW over 8-bit
+# scalar-quantized vectors, where PQ's recall loss is not worth it.
+IVFPQ_MIN_VECTORS = 10_000
+
+# Minimum recall@k of a quantized index against exact search before it replaces float vectors
+MIN_QUANTIZED_RECALL = 0.9
+
+# PDFs shorter than this are extracted in-process by the pypdf fallback; worker start-up would dominate.
+_PARALLEL_MIN_PAGES = 16
+
+
+def _best_device() -> str:
+    """Return the preferred torch device for inference ("cuda" when available, else "cpu")."""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _default_dtype(device: str) -> torch.dtype:
+    """Half precision on GPU (bfloat16 where supported, else float16); float32 on CPU."""
+    if device == "cuda":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    return torch.float32
+
+
+def _extract_page_range(args: Tuple[str, int, int]) -> List[Tuple[int, str]]:
+    """Extract the text of pages [start, stop) of a PDF with pypdf. Runs in a worker process."""
+    path, start, stop = args
     reader = PdfReader(path)
+    return [(i, (reader.pages[i].extract_text() or "").strip()) for i in range(start, stop)]
+
+
+def _extract_pages_pypdf(path: str, max_workers: Optional[int]) -> List[Tuple[int, str]]:
+    """Fallback extraction with pypdf, parallelised over page ranges for longer PDFs."""
+    n = len(PdfReader(path).pages)
+    workers = min(max_workers or os.cpu_count() or 1, n)
+    if n < _PARALLEL_MIN_PAGES or workers <= 1:
+        return _extract_page_range((path, 0, n))
+    step = -(-n // workers)  # ceil division
+    spans = [(path, start, min(start + step, n)) for start in range(0, n, step)]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return [page for span in ex.map(_extract_page_range, spans) for page in span]
+
+
+def extract_pdf_pages(path: str, max_workers: Optional[int] = None) -> List[Document]:
+    """Extracts text pages from a PDF into Document objects with metadata.
+
+    Uses PyMuPDF when installed. Otherwise falls back to pypdf, whose extraction is
+    CPU-bound pure Python, so longer PDFs are split into contiguous page ranges that
+    are extracted in parallel worker processes (max_workers, default: CPU count).
+    """
+    if fitz is not None:
+        with fitz.open(path) as pdf:
+            pages = [(i, page.get_text("text").strip()) for i, page in enumerate(pdf)]
+    else:
+        pages = _extract_pages_pypdf(path, max_workers)
+
     docs: List[Document] = []
-    for i, page in enumerate(reader.pages, start=1):
-        text = (page.extract_text() or "").strip()
+    for i, text in pages:
         if text:
-            docs.append(Document(page_content=text, metadata={"source": os.path.basename(path), "page": i}))
+            docs.append(Document(page_content=text, metadata={"source": os.path.basename(path), "page": i + 1}))
     return docs
 
 
+def _recall_at_k(index: faiss.Index, vectors: np.ndarray, k: int = 3, n_queries: int = 100) -> float:
+    """Fraction of exact top-k neighbours that index returns, for a sample of corpus vectors.
+
+    Each query is itself in the index, and its self-match would be found by any index,
+    so both searches fetch k + 1 results and the query's own id is dropped.
+    """
+    rng = np.random.default_rng(0)
+    ids = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    queries = vectors[ids]
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, k + 1)
+    _, found = index.search(queries, k + 1)
+    hits = total = 0
+    for qid, t, f in zip(ids, truth, found):
+        t = [i for i in t if i != qid and i != -1][:k]
+        f = [i for i in f if i != qid and i != -1][:k]
+        hits += len(set(t) & set(f))
+        total += len(t)
+    return hits / total if total else 1.0
+
+
+def _build_ann_index(
+    vectors: np.ndarray, hnsw_m: int = 32, ivf_nlist: int = 64, pq_m: int = 16
+) -> faiss.Index:
+    """Build an approximate nearest-neighbour L2 index over a (n, d) float32 matrix.
+
+    Large corpora get an IVF-PQ FastScan index (4-bit PQ codes scanned with SIMD kernels)
+    whose shortlist is re-ranked against the full vectors, since PQ distances alone
+    rank neighbours poorly. Smaller ones get an HNSW graph over 8-bit scalar-quantized
+    vectors (4x less memory and bandwidth than float32). Either quantized index is
+    only used if its recall against exact search reaches MIN_QUANTIZED_RECALL;
+    otherwise the next option is tried, down to HNSW over the full vectors.
+    """
+    n, d = vectors.shape
+    if n >= IVFPQ_MIN_VECTORS and d % pq_m == 0:
+        quantizer = faiss.IndexFlatL2(d)
+        ivfpq = faiss.IndexIVFPQFastScan(quantizer, d, ivf_nlist, pq_m, 4)
+        ivfpq.train(vectors)
+        ivfpq.nprobe = 16
+        # 4-bit PQ distances only shortlist candidates; re-rank k_factor * k of them exactly
+        index = faiss.IndexRefineFlat(ivfpq)
+        index.k_factor = 16
+        index.add(vectors)
+        if _recall_at_k(index, vectors) >= MIN_QUANTIZED_RECALL:
+            return index
+
+    index = faiss.IndexHNSWSQ(d, faiss.ScalarQuantizer.QT_8bit, hnsw_m)
+    index.hnsw.efSearch = 64
+    index.train(vectors)
+    index.add(vectors)
+    if _recall_at_k(index, vectors) >= MIN_QUANTIZED_RECALL:
+        return index
+
+    index = faiss.IndexHNSWFlat(d, hnsw_m)
+    index.hnsw.efSearch = 64
+    index.add(vectors)
+    return index
+
+
+def _load_faiss_store(faiss_directory: str, embeddings: HuggingFaceEmbeddings) -> FAISS:
+    """Load a saved FAISS store, memory-mapping the index's codes where FAISS supports it.
+
+    IO_FLAG_MMAP_IFC reads the index through a memory mapping of index.faiss, so the OS
+    page cache backs its codes instead of a private copy made at start-up.
+    Falls back to FAISS.load_local on faiss builds without that flag or if mapping fails.
+    """
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if mmap_flag is None:
+        return FAISS.load_local(faiss_directory, embeddings, allow_dangerous_deserialization=True)
+    try:
+        index = faiss.read_index(os.path.join(faiss_directory, "index.faiss"), mmap_flag)
+    except RuntimeError:
+        return FAISS.load_local(faiss_directory, embeddings, allow_dangerous_deserialization=True)
+    # Same pickle FAISS.save_local writes (the index directory is trusted, as with load_local above)
+    with open(os.path.join(faiss_directory, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+    )
+
+
 def initialize_vector_store(
     pdf_path: str,
     faiss_directory: str = "./faiss_store",
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
     chunk_size: int = 500,
     chunk_overlap: int = 100,
+    embedding_batch_size: int = 64,
 ) -> FAISS:
     """Build or load a FAISS vector store from a PDF. If a FAISS index exists, it is loaded.
 
@@ -46,16 +220,25 @@ def initialize_vector_store(
         embedding_model: Name of the HuggingFace embedding model.
         chunk_size: Number of characters per text chunk.
         chunk_overlap: Overlap between chunks to preserve context.
+        embedding_batch_size: Number of chunks encoded per forward pass of the embedding model.
 
     Returns:
         A FAISS vector store loaded with embeddings from the document.
     """
     os.makedirs(faiss_directory, exist_ok=True)
-    embeddings = HuggingFaceEmbeddings(model_name=embedding_model)
+    device = _best_device()
+    st_kwargs: Dict[str, Any] = {"device": device}
+    if device == "cuda":
+        st_kwargs["model_kwargs"] = {"torch_dtype": torch.float16}
+    embeddings = HuggingFaceEmbeddings(
+        model_name=embedding_model,
+        model_kwargs=st_kwargs,
+        encode_kwargs={"batch_size": embedding_batch_size, "normalize_embeddings": True},
+    )
 
     # If index exists, load it
     if os.path.exists(os.path.join(faiss_directory, "index.faiss")):
-        return FAISS.load_local(faiss_directory, embeddings, allow_dangerous_deserialization=True)
+        return _load_faiss_store(faiss_directory, embeddings)
 
     # Otherwise, create new index
     docs = extract_pdf_pages(pdf_path)
@@ -66,49 +249,367 @@ def initialize_vector_store(
 
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     chunks = splitter.split_documents(docs)
-    vs = FAISS.from_documents(chunks, embeddings)
+    # Encode the whole corpus in batched forward passes, then index the vectors
+    vectors = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype="float32")
+    index = _build_ann_index(vectors)
+    ids = [str(uuid.uuid4()) for _ in chunks]
+    vs = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, chunks))),
+        index_to_docstore_id=dict(enumerate(ids)),
+    )
     vs.save_local(faiss_directory)
     return vs
 
 
-def retrieve_rag_chunks(vector_store: FAISS, query: str, k: int = 3) -> Tuple[str, List[Dict[str, Any]]]:
+def _shingles(text: str, size: int) -> set:
+    """Hashes of all size-character windows of the whitespace/case-normalised text."""
+    norm = " ".join(text.lower().split())
+    if len(norm) <= size:
+        return {hash(norm)}
+    return {hash(norm[i:i + size]) for i in range(len(norm) - size + 1)}
+
+
+def _dedupe_docs(docs: List[Document], threshold: float, shingle_size: int) -> List[Document]:
+    """Drop documents whose shingles are mostly covered by higher-ranked documents."""
+    seen: set = set()
+    kept: List[Document] = []
+    for d in docs:
+        sh = _shingles(d.page_content, shingle_size)
+        if kept and len(sh & seen) > threshold * len(sh):
+            continue
+        kept.append(d)
+        seen |= sh
+    return kept
+
+
+def _truncate_parts(parts: List[str], tokenizer: Any, max_tokens: int) -> List[str]:
+    """Keep parts in order until max_tokens is reached, cutting the last one at the token budget."""
+    out: List[str] = []
+    budget = max_tokens
+    for part in parts:
+        ids = tokenizer.encode(part, add_special_tokens=False)
+        if len(ids) <= budget:
+            out.append(part)
+            budget -= len(ids)
+            continue
+        if budget > 0:
+            out.append(tokenizer.decode(ids[:budget], skip_special_tokens=True))
+        break
+    return out
+
+
+# Tokenizers without a known context length report a huge sentinel model_max_length
+_MAX_PLAUSIBLE_CONTEXT = 1_000_000
+
+
+def _tokenizer_max_length(tokenizer: Any) -> Optional[int]:
+    """tokenizer.model_max_length, or None if it is missing or a placeholder."""
+    max_len = getattr(tokenizer, "model_max_length", None)
+    if not isinstance(max_len, int) or max_len > _MAX_PLAUSIBLE_CONTEXT:
+        return None
+    return max_len
+
+
+def _context_budget(tokenizer: Any, query: str, n_parts: int, max_prompt_tokens: Optional[int]) -> Optional[int]:
+    """Tokens left for context parts once the prompt scaffolding and query are counted.
+
+    max_prompt_tokens is the longest prompt the model accepts, defaulting to the
+    tokenizer's model_max_length. Returns None if neither is known.
+    """
+    max_len = max_prompt_tokens if max_prompt_tokens is not None else _tokenizer_max_length(tokenizer)
+    if max_len is None:
+        return None
+
+    def n_tokens(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    fixed = sum(n_tokens(p) for p in (PROMPT_PREAMBLE, QUESTION_PREFIX, ANSWER_SUFFIX))
+    fixed += max(n_parts - 1, 0) * n_tokens(CONTEXT_SEPARATOR)
+    fixed += n_tokens(query) + (1 if tokenizer.eos_token_id is not None else 0)  # EOS, as in _encode
+    return max(max_len - fixed, 0)
+
+
+def retrieve_rag_chunks(
+    vector_store: FAISS,
+    query: str,
+    k: int = 3,
+    max_context_tokens: Optional[int] = None,
+    tokenizer: Any = None,
+    dedup_threshold: float = 0.5,
+    shingle_size: int = 50,
+    query_vector: Optional[List[float]] = None,
+    max_prompt_tokens: Optional[int] = None,
+) -> Tuple[List[str], List[Dict[str, Any]]]:
     """Retrieve top-k similar chunks from the vector store for a given query.
 
-    Returns a tuple of concatenated context string and a list of citation dicts (source, page).
+    Chunks that mostly repeat text of a higher-ranked chunk (more than dedup_threshold
+    of their shingle_size-character shingles already seen) are dropped. If a tokenizer
+    is given, the context is capped so the whole prompt (scaffolding, context, question
+    and EOS) fits in max_prompt_tokens (default: tokenizer.model_max_length);
+    max_context_tokens, if set, overrides that budget for the context alone. If
+    query_vector (the query's embedding from the vector store's model) is given, it is
+    searched directly instead of embedding the query again.
+
+    Returns a tuple of formatted context parts (one string per chunk, tagged with its
+    source and page) and a list of citation dicts (source, page) for the kept chunks.
+    The parts are joined into the prompt only once, in generate_answer_from_context.
     """
-    retrieved_docs = vector_store.similarity_search(query, k=k)
-    context = "\n\n".join(
+    if query_vector is not None:
+        hits = vector_store.similarity_search_by_vector(query_vector, k=k)
+    else:
+        hits = vector_store.similarity_search(query, k=k)
+    retrieved_docs = _dedupe_docs(hits, dedup_threshold, shingle_size)
+    parts = [
         f"(source={d.metadata.get('source')}, page={d.metadata.get('page')})\n{d.page_content}" for d in retrieved_docs
-    )
+    ]
+    if tokenizer is not None:
+        budget = max_context_tokens
+        if budget is None:
+            budget = _context_budget(tokenizer, query, len(parts), max_prompt_tokens)
+        if budget is not None:
+            parts = _truncate_parts(parts, tokenizer, budget)
     citations = [
-        {"source": d.metadata.get("source"), "page": d.metadata.get("page")} for d in retrieved_docs
+        {"source": d.metadata.get("source"), "page": d.metadata.get("page")} for d in retrieved_docs[:len(parts)]
     ]
-    return context, citations
+    return parts, citations
+
+
+def _vllm_available() -> bool:
+    """True when vLLM is installed and a CUDA device is present."""
+    return importlib.util.find_spec("vllm") is not None and torch.cuda.is_available()
+
+
+# A prompt is either a single string or a sequence of pieces to be concatenated
+Prompt = Union[str, Sequence[str]]
+
+# Sentinel marking the end of a token stream handed between threads
+_STREAM_END = object()
+
+
+class HFSeq2SeqBackend:
+    """Answer generation with a local HuggingFace seq2seq model (flan-t5 by default).
 
+    ``invoke(prompt)`` returns the whole answer; ``stream(prompt)`` yields text pieces as
+    they are decoded, with ``model.generate`` running in a background thread. Prompts may
+    be given as a list of pieces: the fixed scaffolding in STATIC_PROMPT_PIECES is
+    tokenized once at start-up and its token ids are reused, so only the context and
+    the question are tokenized per request.
+    """
+
+    def __init__(self, model: Any, tokenizer: Any, max_new_tokens: int = 220):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max_new_tokens
+        # Encoder input limit; the answer is generated by the decoder and does not count
+        self.max_prompt_tokens = _tokenizer_max_length(tokenizer)
+        self._static_ids: Dict[str, List[int]] = {p: self._tokenize(p) for p in STATIC_PROMPT_PIECES}
+
+    def _tokenize(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False).input_ids
+
+    def _encode(self, prompt: Prompt) -> Dict[str, torch.Tensor]:
+        """Token ids for a prompt, concatenating cached ids for the static pieces."""
+        pieces = [prompt] if isinstance(prompt, str) else prompt
+        ids: List[int] = []
+        for piece in pieces:
+            cached = self._static_ids.get(piece)
+            ids.extend(cached if cached is not None else self._tokenize(piece))
+        # T5-style encoders expect a trailing EOS, which tokenizer(text) would have added
+        if self.tokenizer.eos_token_id is not None:
+            ids.append(self.tokenizer.eos_token_id)
+        input_ids = torch.tensor([ids], device=self.model.device)
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+    def invoke(self, prompt: Prompt) -> str:
+        """Generate a completion for a single prompt."""
+        output_ids = self.model.generate(**self._encode(prompt), max_new_tokens=self.max_new_tokens)
+        return self.tokenizer.decode(output_ids[0], skip_special_tokens=True).strip()
+
+    def stream(self, prompt: Prompt) -> Iterator[str]:
+        """Generate a completion for a single prompt, yielding text as it is produced."""
+        # skip_prompt drops the decoder start token that generate() emits first
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        inputs = {**self._encode(prompt), "max_new_tokens": self.max_new_tokens, "streamer": streamer}
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            try:
+                self.model.generate(**inputs)
+            except BaseException as e:
+                # Unblock the consumer; the error is re-raised in the calling thread below
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            yield from streamer
+        finally:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+
+class VLLMBackend:
+    """Answer generation through vLLM's AsyncLLMEngine (PagedAttention + continuous batching).
+
+    Exposes the same ``invoke(prompt)`` / ``stream(prompt)`` calls as HFSeq2SeqBackend so
+    the agents do not need to know which backend is in use. The engine runs on its own
+    event loop in a background thread; each call submits a request to it from the calling
+    worker thread, so concurrent Gradio users are scheduled together by vLLM instead of
+    one at a time. Automatic prefix caching is enabled so the KV state of
+    PROMPT_PREAMBLE is computed once and shared by later prompts.
+    """
 
-def create_local_llm(model_id: str = "google/flan-t5-base", max_new_tokens: int = 220) -> HuggingFacePipeline:
-    """Initialise a local HuggingFace text-to-text pipeline for answer generation."""
+    def __init__(
+        self, model_id: str = DEFAULT_VLLM_MODEL, max_new_tokens: int = 220, dtype: Optional[torch.dtype] = None
+    ):
+        from vllm import AsyncEngineArgs, AsyncLLMEngine, SamplingParams
+
+        self.model_id = model_id
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        # Greedy decoding, like the HF backend
+        self.sampling_params = SamplingParams(max_tokens=max_new_tokens, temperature=0.0)
+        # bfloat16 only where the GPU supports it (compute capability >= 8.0), else float16
+        dtype_name = str(dtype or _default_dtype("cuda")).removeprefix("torch.")
+        engine_args = AsyncEngineArgs(model=model_id, dtype=dtype_name, enable_prefix_caching=True)
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="vllm-engine", daemon=True).start()
+
+        async def _start_engine():
+            return AsyncLLMEngine.from_engine_args(engine_args)
+
+        # Create the engine on its own loop so its background tasks are bound to it
+        self.engine = asyncio.run_coroutine_threadsafe(_start_engine(), self._loop).result()
+        # Prompt and answer share the engine's context window, so reserve room for the answer
+        model_config = asyncio.run_coroutine_threadsafe(self.engine.get_model_config(), self._loop).result()
+        self.max_prompt_tokens = max(model_config.max_model_len - max_new_tokens, 0)
+
+    async def _generate(self, prompt: str, out: "queue.Queue") -> None:
+        """Submit one request to the engine and put new text into out as it is generated."""
+        sent = 0
+        async for output in self.engine.generate(prompt, self.sampling_params, uuid.uuid4().hex):
+            text = output.outputs[0].text  # cumulative
+            if len(text) > sent:
+                out.put(text[sent:])
+                sent = len(text)
+
+    def stream(self, prompt: Prompt) -> Iterator[str]:
+        """Generate a completion for a single prompt, yielding text as it is produced."""
+        text = prompt if isinstance(prompt, str) else "".join(prompt)
+        out: queue.Queue = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._generate(text, out), self._loop)
+        future.add_done_callback(lambda _: out.put(_STREAM_END))
+        try:
+            while (piece := out.get()) is not _STREAM_END:
+                yield piece
+            future.result()  # re-raise engine errors in the caller
+        finally:
+            # Consumer stopped early: cancelling aborts the request inside the engine
+            future.cancel()
+
+    def invoke(self, prompt: Prompt) -> str:
+        """Generate a completion for a single prompt."""
+        return "".join(self.stream(prompt)).strip()
+
+
+LLMBackend = Union[HFSeq2SeqBackend, VLLMBackend]
+
+
+def _create_hf_backend(
+    model_id: str, max_new_tokens: int, dtype: Optional[torch.dtype], device: Optional[str]
+) -> HFSeq2SeqBackend:
+    """Load a seq2seq model and tokenizer into an HFSeq2SeqBackend.
+
+    On CUDA the model is loaded in 8-bit when bitsandbytes is installed, otherwise in
+    half precision; on CPU it stays in float32.
+    """
+    device = device or _best_device()
     tokenizer = AutoTokenizer.from_pretrained(model_id)
-    model = AutoModelForSeq2SeqLM.from_pretrained(model_id)
-    gen_pipe = pipeline(
-        "text2text-generation", model=model, tokenizer=tokenizer, max_new_tokens=max_new_tokens
-    )
-    return HuggingFacePipeline(pipeline=gen_pipe)
+    model_kwargs: Dict[str, Any] = {}
+    if device == "cuda":
+        model_kwargs["device_map"] = "auto"
+        if importlib.util.find_spec("bitsandbytes") is not None:
+            model_kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+    if "quantization_config" not in model_kwargs:
+        model_kwargs["torch_dtype"] = dtype or _default_dtype(device)
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_id, **model_kwargs)
+    model.eval()
+    return HFSeq2SeqBackend(model, tokenizer, max_new_tokens=max_new_tokens)
+
 
+@lru_cache(maxsize=1)
+def create_local_llm(
+    model_id: Optional[str] = None,
+    max_new_tokens: int = 220,
+    dtype: Optional[torch.dtype] = None,
+    device: Optional[str] = None,
+    backend: str = "auto",
+) -> LLMBackend:
+    """Initialise the local LLM used for answer generation.
 
-def generate_answer_from_context(llm: HuggingFacePipeline, context: str, query: str) -> str:
-    """Generate an answer from provided context and query using the given LLM.
+    The result is cached, so repeated calls with the same arguments reuse the loaded
+    weights instead of reading them from disk again.
 
-    If the answer is not present in the context, the model should return a fallback message.
+    Args:
+        model_id: HuggingFace model id. Defaults to DEFAULT_VLLM_MODEL for vLLM and
+            DEFAULT_HF_MODEL for the HuggingFace backend.
+        max_new_tokens: Maximum number of tokens to generate per answer.
+        dtype: Torch dtype for the weights. Defaults to half precision on GPU (bfloat16 where
+            supported, else float16), float32 on CPU.
+        device: "cuda" or "cpu" for the HF backend. Defaults to the best available device.
+        backend: "vllm", "hf", or "auto" (vLLM when installed and CUDA is available).
+
+    Returns:
+        A VLLMBackend or an HFSeq2SeqBackend; both expose ``invoke(prompt) -> str`` and
+        ``stream(prompt) -> Iterator[str]``.
     """
-    prompt = f"""
-Answer the question strictly using the context below.
-If the answer is not present in the context, say: \"I don't know from the provided documents.\"
+    if backend == "auto":
+        backend = "vllm" if _vllm_available() else "hf"
+    if backend == "vllm":
+        return VLLMBackend(model_id=model_id or DEFAULT_VLLM_MODEL, max_new_tokens=max_new_tokens, dtype=dtype)
+    if backend == "hf":
+        return _create_hf_backend(model_id or DEFAULT_HF_MODEL, max_new_tokens, dtype, device)
+    raise ValueError(f"Unknown LLM backend: {backend!r} (expected 'auto', 'vllm' or 'hf').")
 
-Context:
-{context}
 
-Question: {query}
-Answer:
-""".strip()
-    return llm.invoke(prompt)
+def get_llm_tokenizer(llm: LLMBackend) -> Any:
+    """Return the tokenizer used by an LLM backend (for context token budgeting)."""
+    return llm.tokenizer
+
+
+def get_llm_max_prompt_tokens(llm: LLMBackend) -> Optional[int]:
+    """Return the longest prompt, in tokens, an LLM backend accepts (None if unknown)."""
+    return llm.max_prompt_tokens
+
+
+def generate_answer_from_context(
+    llm: LLMBackend,
+    context_parts: List[str],
+    query: str,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> str:
+    """Generate an answer from retrieved context parts and query using the given LLM.
+
+    The prompt is passed to the backend as a list of pieces (fixed scaffolding, context
+    parts and the query); the backend joins them once, or, for the HF backend, reuses
+    pre-tokenized ids for the scaffolding. If on_token is given, the answer is streamed
+    and on_token is called with each new piece of text as it is generated. If the answer
+    is not present in the context, the model should return a fallback message.
+    """
+    pieces = [PROMPT_PREAMBLE]
+    for i, part in enumerate(context_parts):
+        if i:
+            pieces.append(CONTEXT_SEPARATOR)
+        pieces.append(part)
+    pieces += [QUESTION_PREFIX, query, ANSWER_SUFFIX]
+    if on_token is None:
+        return llm.invoke(pieces)
+    chunks: List[str] = []
+    for text in llm.stream(pieces):
+        chunks.append(text)
+        on_token(text)
+    return "".join(chunks).strip()
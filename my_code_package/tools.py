@@ -4,25 +4,158 @@ This module defines input schemas using pydantic and exposes functions to call e
 or perform computations. Functions return a dictionary with an 'ok' flag and either 'result'
 or 'error' details.
 """
-import re
+import ast
+import asyncio
+import os
+import sys
+import diskcache
+import httpx
 import requests
-from typing import Dict, Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field, ValidationError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 __all__ = [
     "WeatherToolInput",
     "weather_tool_call",
+    "weather_tool_call_async",
     "CalculationInput",
     "calculator_tool_call",
 ]
 
 
+GEOCODING_URL = "https://geocoding-api.open-meteo.com/v1/search"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# Directory of the on-disk geocoding cache (location -> coordinates), kept across restarts
+GEOCODE_CACHE_DIR = os.environ.get("GEOCODE_CACHE_DIR", "./geocode_cache")
+
+# Shared session so TCP/TLS connections to Open-Meteo are pooled and reused across calls
+_RETRY = Retry(total=3, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504))
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRY))
+
+# Async client for the Gradio handlers; created on first use
+_ASYNC_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Return the shared HTTP/2 AsyncClient, creating it on first use."""
+    global _ASYNC_CLIENT
+    if _ASYNC_CLIENT is None:
+        transport = httpx.AsyncHTTPTransport(http2=True, retries=3, limits=httpx.Limits(max_connections=16))
+        _ASYNC_CLIENT = httpx.AsyncClient(timeout=20, transport=transport)
+    return _ASYNC_CLIENT
+
+
+@lru_cache(maxsize=1)
+def _geocode_store() -> diskcache.Cache:
+    """On-disk geocoding cache shared by the sync and async weather tools."""
+    return diskcache.Cache(GEOCODE_CACHE_DIR)
+
+
+def _first_place(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the first result of a geocoding response, or None."""
+    results = payload.get("results")
+    return results[0] if results else None
+
+
+@lru_cache(maxsize=256)
+def _geocode(location: str) -> Optional[Dict[str, Any]]:
+    """Resolve a lowercase location name to the first Open-Meteo geocoding result, or None.
+
+    Results are cached in memory and resolved places are also persisted on disk;
+    request errors propagate and are not cached.
+    """
+    store = _geocode_store()
+    place = store.get(location)
+    if place is None:
+        resp = _SESSION.get(GEOCODING_URL, params={"name": location, "count": 1}, timeout=15)
+        resp.raise_for_status()
+        place = _first_place(resp.json())
+        if place is not None:
+            store.set(location, place)
+    return place
+
+
+# In-process LRU of resolved places for the async path (the sync path uses lru_cache)
+_GEOCODE_MEMO: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_GEOCODE_MEMO_SIZE = 256
+
+
+def _remember_place(location: str, place: Dict[str, Any]) -> None:
+    """Record a resolved place in _GEOCODE_MEMO, evicting the least recently used entry."""
+    _GEOCODE_MEMO[location] = place
+    _GEOCODE_MEMO.move_to_end(location)
+    if len(_GEOCODE_MEMO) > _GEOCODE_MEMO_SIZE:
+        _GEOCODE_MEMO.popitem(last=False)
+
+
+async def _geocode_async(location: str) -> Optional[Dict[str, Any]]:
+    """Async counterpart of _geocode, sharing its on-disk cache.
+
+    Memory hits never leave the event loop; disk reads and writes run in a worker
+    thread so a slow disk cannot stall other requests.
+    """
+    place = _GEOCODE_MEMO.get(location)
+    if place is not None:
+        _GEOCODE_MEMO.move_to_end(location)
+        return place
+    store = await asyncio.to_thread(_geocode_store)
+    place = await asyncio.to_thread(store.get, location)
+    if place is None:
+        resp = await _get_async_client().get(GEOCODING_URL, params={"name": location, "count": 1}, timeout=15)
+        resp.raise_for_status()
+        place = _first_place(resp.json())
+        if place is not None:
+            await asyncio.to_thread(store.set, location, place)
+    if place is not None:
+        _remember_place(location, place)
+    return place
+
+
 class WeatherToolInput(BaseModel):
     """Input schema for the weather tool."""
     location: str = Field(..., description="City name like Chennai, Mumbai, London")
     days: int = Field(3, ge=1, le=7, description="Forecast days (1 to 7)")
 
 
+def _forecast_params(place: Dict[str, Any], days: int) -> Dict[str, Any]:
+    """Query parameters for the Open-Meteo daily forecast of a geocoded place."""
+    return {
+        "latitude": place["latitude"],
+        "longitude": place["longitude"],
+        "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max",
+        "forecast_days": days,
+        "timezone": "auto",
+    }
+
+
+def _forecast_result(place: Dict[str, Any], days: int, fj: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert an Open-Meteo forecast response into the weather tool's result dict."""
+    daily = fj.get("daily", {})
+    forecast = []
+    n = len(daily.get("time", []))
+    for i in range(n):
+        forecast.append({
+            "date": daily["time"][i],
+            "temp_max_c": daily["temperature_2m_max"][i],
+            "temp_min_c": daily["temperature_2m_min"][i],
+            "precip_mm": daily["precipitation_sum"][i],
+            "wind_max_kmh": daily["wind_speed_10m_max"][i],
+        })
+
+    return {
+        "ok": True,
+        "location": f"{place.get('name')}, {place.get('country')}",
+        "forecast_days": days,
+        "forecast": forecast,
+    }
+
+
 def weather_tool_call(data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Call the Open‑Meteo API to fetch a weather forecast for the given location and number of days.
@@ -45,54 +178,55 @@ def weather_tool_call(data: Dict[str, Any]) -> Dict[str, Any]:
         return {"ok": False, "error": "Location cannot be empty."}
 
     # Step 1: Geocode to get latitude and longitude
-    geo_url = "https://geocoding-api.open-meteo.com/v1/search"
     try:
-        gr = requests.get(geo_url, params={"name": loc, "count": 1}, timeout=15)
-        gr.raise_for_status()
-        gj = gr.json()
+        place = _geocode(loc.lower())
     except Exception as e:
         return {"ok": False, "error": f"Geocoding failed: {e}"}
 
-    if not gj.get("results"):
+    if place is None:
         return {"ok": False, "error": f"Location not found: {loc}"}
 
-    place = gj["results"][0]
-    lat, lon = place["latitude"], place["longitude"]
-
     # Step 2: Fetch forecast
-    forecast_url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max",
-        "forecast_days": inp.days,
-        "timezone": "auto",
-    }
     try:
-        fr = requests.get(forecast_url, params=params, timeout=20)
+        fr = _SESSION.get(FORECAST_URL, params=_forecast_params(place, inp.days), timeout=20)
         fr.raise_for_status()
         fj = fr.json()
     except Exception as e:
         return {"ok": False, "error": f"Forecast failed: {e}"}
 
-    daily = fj.get("daily", {})
-    forecast = []
-    n = len(daily.get("time", []))
-    for i in range(n):
-        forecast.append({
-            "date": daily["time"][i],
-            "temp_max_c": daily["temperature_2m_max"][i],
-            "temp_min_c": daily["temperature_2m_min"][i],
-            "precip_mm": daily["precipitation_sum"][i],
-            "wind_max_kmh": daily["wind_speed_10m_max"][i],
-        })
+    return _forecast_result(place, inp.days, fj)
 
-    return {
-        "ok": True,
-        "location": f"{place.get('name')}, {place.get('country')}",
-        "forecast_days": inp.days,
-        "forecast": forecast,
-    }
+
+async def weather_tool_call_async(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Async version of weather_tool_call, using a shared httpx.AsyncClient so concurrent
+    users do not block each other while waiting on Open‑Meteo. Returns the same dict.
+    """
+    try:
+        inp = WeatherToolInput(**data)
+    except ValidationError as e:
+        return {"ok": False, "error": str(e)}
+
+    loc = inp.location.strip()
+    if not loc:
+        return {"ok": False, "error": "Location cannot be empty."}
+
+    try:
+        place = await _geocode_async(loc.lower())
+    except Exception as e:
+        return {"ok": False, "error": f"Geocoding failed: {e}"}
+
+    if place is None:
+        return {"ok": False, "error": f"Location not found: {loc}"}
+
+    try:
+        fr = await _get_async_client().get(FORECAST_URL, params=_forecast_params(place, inp.days))
+        fr.raise_for_status()
+        fj = fr.json()
+    except Exception as e:
+        return {"ok": False, "error": f"Forecast failed: {e}"}
+
+    return _forecast_result(place, inp.days, fj)
 
 
 # class CalculationInput(BaseModel):
@@ -135,10 +269,114 @@ class CalculationInput(BaseModel):
         ..., description="Math expression, e.g. sin(pi/2) + sqrt(16) - 3**2"
     )
 
+
+# Bounds that keep a single expression from pinning a CPU thread. Integer powers are
+# capped at the size Python can still convert to a decimal string (0 means unlimited).
+_MAX_FACTORIAL = 1_000       # largest factorial argument
+_MAX_POW_BITS = int((sys.get_int_max_str_digits() or 30_000) * math.log2(10))
+
+
+def _checked_pow(base: Any, exp: Any, mod: Any = None) -> Any:
+    """pow() that refuses integer powers whose result would exceed _MAX_POW_BITS."""
+    if mod is not None:
+        return pow(base, exp, mod)  # modular exponentiation stays small
+    if (
+        isinstance(base, int) and isinstance(exp, int) and exp > 0 and abs(base) > 1
+        and exp * math.log2(abs(base)) > _MAX_POW_BITS
+    ):
+        raise ValueError("Result too large.")
+    return pow(base, exp)
+
+
+def _checked_factorial(n: Any) -> int:
+    """math.factorial() limited to arguments up to _MAX_FACTORIAL."""
+    if isinstance(n, (int, float)) and n > _MAX_FACTORIAL:
+        raise ValueError(f"factorial argument must be at most {_MAX_FACTORIAL}.")
+    return math.factorial(n)
+
+
+# Names the calculator may reference: math functions and constants
+_ALLOWED_NAMES: Dict[str, Any] = {
+    "abs": abs,
+    "pow": _checked_pow,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "sqrt": math.sqrt,
+    "log": math.log,       # natural log
+    "log10": math.log10,   # base-10 log
+    "exp": math.exp,
+    "factorial": _checked_factorial,
+    "pi": math.pi,
+    "e": math.e,
+}
+
+# AST node types permitted in a calculator expression
+_SAFE_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Call, ast.Name, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+)
+
+
+# Globals for evaluating compiled expressions; "__pow" is only reachable via _PowToCall
+_EVAL_GLOBALS: Dict[str, Any] = {"__builtins__": {}, "__pow": _checked_pow}
+
+
+def _constant_value(node: ast.AST) -> Any:
+    """Value of a numeric literal, optionally signed (e.g. -3); None for anything else."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _constant_value(node.operand)
+        return -value if value is not None and isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, complex)):
+        return node.value
+    return None
+
+
+class _PowToCall(ast.NodeTransformer):
+    """Rewrite ``a ** b`` as ``__pow(a, b)`` so computed exponents are bounded at runtime."""
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.Pow):
+            return node
+        call = ast.Call(func=ast.Name(id="__pow", ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return ast.copy_location(call, node)
+
+
+@lru_cache(maxsize=512)
+def _compile_expr(expr: str):
+    """Parse and validate an expression once, returning a cached code object.
+
+    Raises ValueError if the expression uses anything other than numeric literals,
+    arithmetic operators, and calls to the whitelisted names, or if a literal factorial
+    argument is out of bounds. Powers and computed factorial arguments (e.g. ``9**9**9``)
+    are checked when evaluated.
+    """
+    tree = ast.parse(expr, mode="eval")
+    for node in ast.walk(tree):
+        if not isinstance(node, _SAFE_NODES):
+            raise ValueError(f"Unsupported syntax: {type(node).__name__}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, complex)):
+            raise ValueError(f"Unsupported literal: {node.value!r}")
+        if isinstance(node, ast.Name) and node.id not in _ALLOWED_NAMES:
+            raise ValueError(f"Unknown name: {node.id}")
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords):
+            raise ValueError("Only positional calls to supported functions are allowed.")
+        if isinstance(node, ast.Call) and node.func.id == "factorial" and node.args:
+            arg = _constant_value(node.args[0])
+            if isinstance(arg, (int, float)) and arg > _MAX_FACTORIAL:
+                raise ValueError(f"factorial argument must be at most {_MAX_FACTORIAL}.")
+    tree = ast.fix_missing_locations(_PowToCall().visit(tree))
+    return compile(tree, "<calc>", "eval")
+
+
 def calculator_tool_call(data: Dict[str, Any]) -> Dict[str, Any]:
     """
     Evaluate an arithmetic or scientific expression using a restricted set of
-    operators and functions. Supported operations include +, -, *, /, %, **,
+    operators and functions. Supported operations include +, -, *, /, //, %, **,
     and functions such as sqrt, log, sin, cos, tan, exp, factorial, as well as
     the constants pi and e. Returns {'ok': True, 'result': value} on success,
     otherwise {'ok': False, 'error': ...}.
@@ -152,28 +390,12 @@ def calculator_tool_call(data: Dict[str, Any]) -> Dict[str, Any]:
     if not expr:
         return {"ok": False, "error": "Expression cannot be empty."}
 
-    # Define allowed names mapping to math functions and constants
-    allowed_names: Dict[str, Any] = {
-        "abs": abs,
-        "pow": pow,
-        "sin": math.sin,
-        "cos": math.cos,
-        "tan": math.tan,
-        "asin": math.asin,
-        "acos": math.acos,
-        "atan": math.atan,
-        "sqrt": math.sqrt,
-        "log": math.log,       # natural log
-        "log10": math.log10,   # base-10 log
-        "exp": math.exp,
-        "factorial": math.factorial,
-        "pi": math.pi,
-        "e": math.e,
-    }
-
     try:
-        # Evaluate the expression safely with no builtins and only allowed names
-        result = eval(expr, {"__builtins__": {}}, allowed_names)
+        # Evaluate the validated, cached code object with no builtins and only allowed names
+        result = eval(_compile_expr(expr), _EVAL_GLOBALS, _ALLOWED_NAMES)
+        # Products of bounded terms can still exceed the int-to-str digit limit; fail here
+        # rather than when the answer is formatted
+        str(result)
         return {"ok": True, "result": result}
     except Exception as e:
         return {"ok": False, "error": f"Calculation failed: {e}"}